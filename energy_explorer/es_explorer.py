@@ -1,9 +1,12 @@
-from datetime import timedelta
-from typing import List, Union
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Any, Dict, List, Union
 
-from numpy import array, greater, less, percentile, zeros
-from pandas import DataFrame
-from scipy.signal import argrelextrema
+from numpy import cumsum, diff, flatnonzero, lexsort, ones, pad, split, stack
+from numpy.typing import NDArray
+from pandas import DataFrame, Series, factorize, get_dummies
+from scipy.ndimage import maximum_filter1d, percentile_filter
 
 from energy_explorer.objects import (AccelerationPeaks, CapacityDistribution,
                                      CapacitySeries)
@@ -22,18 +25,24 @@ def get_unique_zip_geo(frame: DataFrame):
     Returns:
         Tuple of two numpy arrays: zipcodes and geo_coords.
     """
-    unique_zipcodes = frame.facility_zipcode.drop_duplicates().index
-    unique_geo_df = frame.loc[unique_zipcodes, frame.geo_coords]
-    unique_geo = array([(geo[0], geo[1]) for geo in unique_geo_df])
+    # Positions of the first entry of each zipcode, so only the two needed columns are gathered
+    positions = flatnonzero(~frame.facility_zipcode.duplicated().to_numpy())
 
-    return frame.loc[unique_zipcodes, frame.facility_zipcode].values, unique_geo
+    unique_zipcodes = frame.facility_zipcode.to_numpy()[positions]
+    unique_geo = stack(frame.geo_coords.to_numpy()[positions]).astype(float)
+
+    return unique_zipcodes, unique_geo
 
 
 # FUEL TYPES & CAPACITY
 
 
 def get_capacity_distribution(
-    frame: DataFrame, fuel_type: Union[str, List[str]], exclusive: bool = False, shared: bool = True
+    frame: DataFrame,
+    fuel_type: Union[str, List[str]],
+    exclusive: bool = False,
+    shared: bool = True,
+    onehot: DataFrame = None,
 ) -> CapacityDistribution:
     """
     Creates a capacity distribution for specified fuel types with optional exclusive filtering and shared capacity.
@@ -43,25 +52,50 @@ def get_capacity_distribution(
         fuel_type: A single fuel type as a string or a list of fuel types.
         exclusive: If True, selects only entries containing exactly the fuel types in fuel_type.
         shared: If True, divides the entry capacity by the number of fuel types in each entry.
+        onehot: Optional; a precomputed fuel type one-hot table from `build_fuel_onehot`.
 
     Returns:
         CapacityDistribution: Distribution containing filtered capacities and counts for the specified fuel type(s).
     """
-    selected_entries = query_fuel_types(frame, fuel_type, exclusive)
+    selected_entries = query_fuel_types(frame, fuel_type, exclusive, onehot=onehot)
 
     # Calculate shared or net capacity based on the shared argument
+    capacity = selected_entries.nameplate_capacity.to_numpy()
     if shared:
-        capacity_values = selected_entries.nameplate_capacity / selected_entries.fuel_types.apply(len)
+        n_fuels = count_fuel_types(selected_entries)
+        capacity_values = capacity / n_fuels
+        fuel_counts = n_fuels
     else:
-        capacity_values = selected_entries.nameplate_capacity
-
-    # Determine counts for each selected entry
-    fuel_counts = selected_entries.fuel_types.apply(len) if shared else zeros(len(selected_entries), dtype=int) + 1
+        capacity_values = capacity
+        fuel_counts = ones(len(capacity), dtype=int)
 
     return CapacityDistribution(fuel_type=fuel_type, capacity=capacity_values, count=fuel_counts)
 
 
-def query_fuel_types(frame: DataFrame, fuel_type: Union[str, List[str]], exclusive: bool = False) -> DataFrame:
+def build_fuel_onehot(frame: DataFrame) -> DataFrame:
+    """
+    Builds a boolean one-hot table of fuel types, with one column per distinct fuel type.
+
+    Args:
+        frame: The DataFrame containing the (list-valued) fuel types.
+
+    Returns:
+        A boolean DataFrame aligned with the index of `frame`.
+    """
+    # Key each entry by its combination of fuel types, of which there are only a few distinct ones
+    codes, combinations = factorize(frame.fuel_types.map(tuple))
+
+    # Encode each distinct combination once (an empty combination explodes to NaN, which has no dummies), and expand
+    # the encodings back onto the entries, keeping one row per combination so the rows line up with the codes
+    combination_onehot = get_dummies(Series(combinations).explode(), dtype=bool).groupby(level=0).any()
+    combination_onehot = combination_onehot.reindex(range(len(combinations)), fill_value=False)
+
+    return DataFrame(combination_onehot.to_numpy()[codes], index=frame.index, columns=combination_onehot.columns)
+
+
+def query_fuel_types(
+    frame: DataFrame, fuel_type: Union[str, List[str]], exclusive: bool = False, onehot: DataFrame = None
+) -> DataFrame:
     """
     Filters the DataFrame based on fuel type combinations.
 
@@ -69,6 +103,8 @@ def query_fuel_types(frame: DataFrame, fuel_type: Union[str, List[str]], exclusi
         frame: The DataFrame containing cumulative capacities and fuel types.
         fuel_type: A single fuel type or list of fuel types for filtering.
         exclusive: If True, selects only entries containing exactly the fuel types.
+        onehot: Optional; a precomputed fuel type one-hot table from `build_fuel_onehot`, which must cover the index of
+            `frame`. Without it, the fuel types of each entry are matched one by one.
 
     Returns:
         A filtered DataFrame based on the specified fuel type combinations.
@@ -76,17 +112,55 @@ def query_fuel_types(frame: DataFrame, fuel_type: Union[str, List[str]], exclusi
     if isinstance(fuel_type, str):
         fuel_filter = [fuel_type]
     else:
-        fuel_filter = fuel_type
+        fuel_filter = list(fuel_type)
 
-    if exclusive:
+    # Building the one-hot table costs about as much as a single query, so without one match the entries directly
+    if onehot is None:
         required_types = set(fuel_filter)
-        condition = frame.fuel_types.apply(lambda types: set(types) == required_types)
+        if exclusive and "n_fuels" in frame:
+            # Only entries with as many fuel types as required can match, so compare the sets of those alone
+            condition = frame.n_fuels.to_numpy() == len(required_types)
+            condition[condition] = [set(types) == required_types for types in frame.fuel_types.to_numpy()[condition]]
+        elif exclusive:
+            condition = frame.fuel_types.apply(lambda types: set(types) == required_types).to_numpy()
+        else:
+            condition = frame.fuel_types.apply(lambda types: any(ft in types for ft in fuel_filter)).to_numpy()
+
+        return frame[condition]
+
+    # Align the one-hot table with the frame
+    if not onehot.index.equals(frame.index):
+        onehot = onehot.loc[frame.index]
+
+    # Unknown fuel types simply never match
+    selected = onehot.reindex(columns=fuel_filter, fill_value=False).to_numpy()
+
+    if exclusive:
+        # Only entries with as many (distinct) fuel types as required can match, so check the membership of those alone
+        condition = onehot.to_numpy().sum(axis=1) == len(set(fuel_filter))
+        condition[condition] = selected[condition].all(axis=1)
     else:
-        condition = frame.fuel_types.apply(lambda types: any(ft in types for ft in fuel_filter))
+        condition = selected.any(axis=1)
 
     return frame[condition]
 
 
+def count_fuel_types(frame: DataFrame) -> NDArray[int]:
+    """
+    Counts the fuel types of each entry, using the cached `n_fuels` column when present.
+
+    Args:
+        frame: The DataFrame containing the (list-valued) fuel types.
+
+    Returns:
+        NDArray[int]: The number of fuel types of each entry.
+    """
+    if "n_fuels" in frame:
+        return frame.n_fuels.to_numpy()
+
+    return frame.fuel_types.str.len().to_numpy()
+
+
 def query_capacity_series(
     es_frame: DataFrame,
     fuel_type: str | List[str],
@@ -95,6 +169,7 @@ def query_capacity_series(
     group_by: str = "facility_zipcode",
     n_groups: int = None,
     select_from: str = "highest",
+    onehot: DataFrame = None,
 ) -> DataFrame:
     """
     Selects and returns a filtered DataFrame based on fuel type, sector, and group-based cumulative capacity.
@@ -107,6 +182,7 @@ def query_capacity_series(
         group_by: The column used to group data (e.g., 'facility_zipcode').
         n_groups: Number of groups to return based on cumulative capacity.
         select_from: Determines if the function returns the "highest", "middle", or "lowest" n_groups.
+        onehot: Optional; a precomputed fuel type one-hot table from `build_fuel_onehot`.
 
     Returns:
         DataFrame: A filtered DataFrame including entries for selected groups based on rated capacity.
@@ -115,36 +191,99 @@ def query_capacity_series(
     es_frame_sel = es_frame[es_frame.customer_sector == sector]
 
     # Filter data based on fuel types
-    es_frame_sel = query_fuel_types(es_frame_sel, fuel_type, exclusive=exclusive)
-
-    # Identify cumulative capacity by group
-    capacity_sum_by_group = es_frame_sel.groupby(group_by).nameplate_capacity.sum().sort_values()
+    es_frame_sel = query_fuel_types(es_frame_sel, fuel_type, exclusive=exclusive, onehot=onehot)
 
     # Select groups based on n_groups if specified
     if n_groups is not None:
+        # Identify cumulative capacity by group (unsorted, since only the "middle" selection needs a full sort)
+        capacity_sum_by_group = es_frame_sel.groupby(group_by, observed=True, sort=False).nameplate_capacity.sum()
+
         if select_from.lower() == "highest":
             selected_groups = capacity_sum_by_group.nlargest(n_groups).index
         elif select_from.lower() == "lowest":
             selected_groups = capacity_sum_by_group.nsmallest(n_groups).index
         elif select_from.lower() == "middle":
+            capacity_sum_by_group = capacity_sum_by_group.sort_values()
             mid_start = (len(capacity_sum_by_group) - n_groups) // 2
             selected_groups = capacity_sum_by_group.iloc[mid_start : mid_start + n_groups].index
         else:
             raise ValueError("select_from must be one of 'highest', 'middle', or 'lowest'")
 
-        # Make the selection, and sort them by the datetime
+        # Make the selection
         selected_frame = es_frame_sel[es_frame_sel[group_by].isin(selected_groups)]
     else:
         # Return all groups if n_groups is None
         selected_frame = es_frame_sel
 
-    # Sort the selected frame by approval date
-    selected_frame = selected_frame.sort_values(by="approval_date", ascending=True)
+    # Sort the selected frame by approval date (stable, so entries sharing a date keep their original order)
+    selected_frame = selected_frame.sort_values(by="approval_date", kind="stable")
 
     # Remove duplicate approval dates by keeping the first occurrence
-    selected_frame = selected_frame[~selected_frame.duplicated(subset="approval_date", keep="first")]
+    return selected_frame.drop_duplicates(subset="approval_date", keep="first")
+
 
-    return selected_frame
+def _smooth_capacity_series(
+    date: NDArray, capacity: NDArray, start: datetime, end: datetime, delta: timedelta, sigma: timedelta
+) -> CapacitySeries:
+    """Creates and smooths the series of a group's (sorted) approval dates and cumulative capacities [MW]."""
+    capacity_series = CapacitySeries(time=date, capacity=capacity)
+    capacity_series.smooth(start=start, end=end, delta=delta, sigma=sigma)
+
+    return capacity_series
+
+
+def build_group_capacity_series(
+    frame: DataFrame,
+    group_by: str,
+    start: datetime,
+    end: datetime,
+    delta: timedelta,
+    sigma: timedelta,
+    n_workers: int = 1,
+) -> Dict[Any, CapacitySeries]:
+    """
+    Builds the smoothed, cumulative capacity series of each group in the DataFrame. The groups are independent, so
+    they may be built in parallel worker processes.
+
+    Args:
+        frame: The DataFrame containing energy storage data (e.g. as selected by `query_capacity_series`).
+        group_by: The column used to group data (e.g., 'facility_zipcode').
+        start: Start datetime of the smoothing time range.
+        end: End datetime of the smoothing time range.
+        delta: Time step size of the smoothing grid.
+        sigma: Standard deviation of the Gaussian smoothing kernel.
+        n_workers: Number of worker processes; the series are built serially if 1.
+
+    Returns:
+        Dict mapping each group, in order of first appearance, to its CapacitySeries.
+    """
+    # Order the entries by group (in order of first appearance), and by approval date within each group
+    group_codes, group_ids = factorize(frame[group_by], sort=False)
+    dates = frame.approval_date.to_numpy()
+    order = lexsort((dates, group_codes))
+    order = order[group_codes[order] >= 0]  # Drop entries without a group
+    group_codes, dates = group_codes[order], dates[order]
+    if len(order) == 0:
+        return {}
+
+    # Split the sorted arrays into the entries of each group
+    boundaries = flatnonzero(diff(group_codes)) + 1
+    group_dates = split(dates, boundaries)
+
+    # Calculate the cumulative capacity of each group (a plain running sum, so that the rounding of the summation, and
+    # with it the acceleration peaks, match those of a per-group `Series.cumsum`)
+    capacity = frame.nameplate_capacity.to_numpy()[order]
+    group_capacities = [cumsum(group) / 1000 for group in split(capacity, boundaries)]  # Convert to MW
+
+    smooth = partial(_smooth_capacity_series, start=start, end=end, delta=delta, sigma=sigma)
+    if n_workers > 1:
+        chunksize = max(1, len(group_dates) // (4 * n_workers))
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            all_series = list(executor.map(smooth, group_dates, group_capacities, chunksize=chunksize))
+    else:
+        all_series = [smooth(date, capacity) for date, capacity in zip(group_dates, group_capacities)]
+
+    return dict(zip(group_ids, all_series))
 
 
 if __name__ == "__main__":
@@ -171,14 +310,15 @@ def find_acceleration_peaks(
 ) -> AccelerationPeaks:
     """
     Identify isolated positive and negative peaks in the acceleration of a smoothed CapacitySeries object.
-    Peaks are defined as local maxima/minima that meet a threshold based on the 95th percentile of nearby values.
+    Peaks are defined as local maxima/minima, valued by the rolling 95th (maxima) or 5th (minima) percentile of nearby
+    values.
 
     Args:
         capacity_series: The CapacitySeries object containing time and capacity (already smoothed).
         sigma: The sigma used in the Gaussian smoothing kernel, used to determine the minimum distance between peaks.
 
     Returns:
-        AccelerationPeaks: A dataclass containing arrays of minima and maxima peaks.
+        AccelerationPeaks: A dataclass containing the times and values of the minima and maxima peaks.
     """
     # Convert sigma to an integer number of points based on time spacing
     t_interval = (capacity_series.time[1] - capacity_series.time[0]).astype("timedelta64[s]").item().total_seconds()
@@ -188,26 +328,32 @@ def find_acceleration_peaks(
     acceleration = capacity_series.acceleration
 
     # Find indices of relative maxima and minima in acceleration
-    max_indices = argrelextrema(acceleration, comparator=greater, order=t_width)[0]
-    min_indices = argrelextrema(acceleration, comparator=less, order=t_width)[0]
-
-    # Helper function to extract 95th percentile peak values in a window around each peak
-    def get_peaks(indices, percentile_target):
-        peak_times = []
-        peak_values = []
-
-        for n in indices:
-            start = max(0, n - t_width)
-            end = min(len(acceleration), n + t_width)
-            peak_val = percentile(acceleration[start:end], percentile_target)
+    max_indices = _relative_maxima(acceleration, order=t_width)
+    min_indices = _relative_maxima(-acceleration, order=t_width)
+
+    # Rolling 95th (maxima) and 5th (minima) percentiles over the window [n - t_width, n + t_width)
+    upper = percentile_filter(acceleration, percentile=95, size=2 * t_width)
+    lower = percentile_filter(acceleration, percentile=5, size=2 * t_width)
+
+    return AccelerationPeaks(
+        min_times=capacity_series.time[min_indices],
+        min_values=lower[min_indices],
+        max_times=capacity_series.time[max_indices],
+        max_values=upper[max_indices],
+    )
 
-            peak_times.append(capacity_series.time[n])
-            peak_values.append(peak_val)
 
-        return array(list(zip(peak_times, peak_values)))
+def _relative_maxima(values: NDArray[float], order: int) -> NDArray[int]:
+    """
+    Finds the indices of values strictly greater than every other value within `order` points on either side, with the
+    window clipped at the edges. This matches `argrelextrema(values, greater, order=order)`, but compares against the
+    running maximum of each side window (a single O(N) filter pass) instead of `order` shifted copies of the array.
+    """
+    padded = pad(values, order, mode="edge")
 
-    # Calculate maxima and minima using the 95th percentile for maxima and 5th percentile for minima
-    maxima = get_peaks(max_indices, 95)
-    minima = get_peaks(min_indices, 5)
+    # window_max[j] is the maximum of padded[j : j + order]
+    window_max = maximum_filter1d(padded, size=order)[order // 2 :]
+    left_max = window_max[: len(values)]
+    right_max = window_max[order + 1 : order + 1 + len(values)]
 
-    return AccelerationPeaks(minima=minima, maxima=maxima)
+    return flatnonzero((values > left_max) & (values > right_max))
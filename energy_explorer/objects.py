@@ -1,9 +1,9 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from typing import List, Optional, Tuple, Union
 
-from numpy import (arange, argmax, argmin, array, convolve, datetime64, diff,
-                   exp, interp, mean, nan, pad, timedelta64)
+from numpy import (arange, argmax, argmin, convolve, datetime64, diff, exp,
+                   interp, maximum, mean, nan, pad, timedelta64)
 from numpy.typing import NDArray
 
 
@@ -21,6 +21,7 @@ class EnergyStorage:
     customer_sector: str
     approval_date: datetime
     geo_coords: Optional[Tuple[float, float]] = None
+    n_fuels: Optional[int] = None
 
 
 @dataclass
@@ -38,16 +39,27 @@ class CapacitySeries:
 
     time: NDArray[Union[datetime, datetime64]]
     capacity: NDArray[float]
+    _acceleration: Optional[NDArray[float]] = field(default=None, init=False, repr=False, compare=False)
+
+    def __setattr__(self, name: str, value) -> None:
+        """Sets an attribute, dropping the cached acceleration whenever the time or capacity is replaced."""
+        super().__setattr__(name, value)
+        if name in ("time", "capacity"):
+            super().__setattr__("_acceleration", None)
 
     @property
     def acceleration(self) -> NDArray[float]:
         """
         Computes the second derivative of the capacity. The resulting array will have the same length as `time` and
-        `capacity`, with the edge values padded accordingly.
+        `capacity`, with the edge values padded accordingly. The result is cached (read-only) until `time` or
+        `capacity` is reassigned, e.g. by `smooth`; in-place edits of the capacity elements are not tracked.
 
         Returns:
             NDArray of the second derivative (acceleration) of the capacity with the same length as the time array.
         """
+        if self._acceleration is not None:
+            return self._acceleration
+
         # Calculate the second derivative using `diff`
         acceleration_ = diff(self.capacity, n=2)
 
@@ -58,6 +70,9 @@ class CapacitySeries:
 
             acceleration = concatenate([[0], acceleration_])
 
+        acceleration.flags.writeable = False
+        self._acceleration = acceleration
+
         return acceleration
 
     def smooth(
@@ -78,16 +93,16 @@ class CapacitySeries:
         start_ = datetime64(start, "s")
         end_ = datetime64(end, "s")
 
-        # Generate new time grid within the specified range
-        size_ = int((end_ - start_) / timedelta64(int(delta.total_seconds()), "s"))
-        new_times = array(
-            [start_ + i * timedelta64(int(delta.total_seconds()), "s") for i in range(size_)],
-            dtype="datetime64[s]",
-        )
+        # Generate new time grid within the specified range, as integer seconds
+        step = int(delta.total_seconds())
+        size_ = int((end_ - start_) / timedelta64(step, "s"))
+        new_seconds = start_.astype("int64") + arange(size_, dtype="int64") * step
+        new_times = new_seconds.view("datetime64[s]")
 
-        # Linear interpolation using numpy's interp (without extrapolation)
-        new_times_float = new_times.astype("datetime64[s]").astype(float)
-        original_times_float = self.time.astype("datetime64[s]").astype(float)
+        # Linear interpolation using numpy's interp (without extrapolation). The capacity is kept in float64, since the
+        # acceleration is a second difference and float32 rounding is of the same order as its peaks.
+        new_times_float = new_seconds.astype(float)
+        original_times_float = self.time.astype("datetime64[s]", copy=False).view("int64").astype(float)
         interpolated_capacity = interp(new_times_float, original_times_float, self.capacity)
 
         # Define Gaussian kernel based on sigma
@@ -98,13 +113,15 @@ class CapacitySeries:
         kernel = exp(-0.5 * (kernel_range / sigma.total_seconds()) ** 2)
         kernel /= kernel.sum()  # Normalize the kernel
 
-        # Convolve with kernel and trim edge data based on kernel radius
+        # Convolve with kernel and trim edge data based on kernel radius. The direct convolution is kept on purpose:
+        # filters that sum in a different order (FFT-based, or `gaussian_filter1d` folding the symmetric kernel) turn
+        # the exactly-zero accelerations of flat stretches into round-off noise, which is detected as spurious peaks.
         smoothed_capacity = convolve(interpolated_capacity, kernel, mode="same")
         trimmed_times = new_times[kernel_radius:-kernel_radius]
         trimmed_capacity = smoothed_capacity[kernel_radius:-kernel_radius]
 
         # Ensure all capacity values are non-negative
-        trimmed_capacity[trimmed_capacity < 0] = 0
+        maximum(trimmed_capacity, 0.0, out=trimmed_capacity)
 
         # Update instance attributes with aligned time and capacity arrays
         self.time = trimmed_times
@@ -114,30 +131,34 @@ class CapacitySeries:
 @dataclass
 class AccelerationPeaks:
     """
-    Dataclass for storing acceleration peak information.
+    Dataclass for storing acceleration peak information, as parallel arrays of peak times and values.
 
     Attributes:
-        minima: NDArray of shape (N, 2) containing (time, peak_value) for each detected minimum.
-        maxima: NDArray of shape (N, 2) containing (time, peak_value) for each detected maximum.
+        min_times: NDArray of the times of each detected minimum.
+        min_values: NDArray of the peak values of each detected minimum.
+        max_times: NDArray of the times of each detected maximum.
+        max_values: NDArray of the peak values of each detected maximum.
     """
 
-    minima: NDArray[float]
-    maxima: NDArray[float]
+    min_times: NDArray[datetime64]
+    min_values: NDArray[float]
+    max_times: NDArray[datetime64]
+    max_values: NDArray[float]
 
     @property
-    def max(self) -> tuple[Union[datetime, float], float]:
+    def max(self) -> tuple[Union[datetime64, float], float]:
         """Returns the (time, value) of the maximum value in the maxima peaks, or (nan, nan) if no valid maxima."""
-        if self.maxima.ndim == 2 and self.maxima.shape[1] == 2 and len(self.maxima) > 0:
-            m = argmax(self.maxima[:, 1])
-            return self.maxima[m, 0], self.maxima[m, 1]
+        if len(self.max_values) > 0:
+            m = argmax(self.max_values)
+            return self.max_times[m], self.max_values[m]
         return nan, nan
 
     @property
-    def min(self) -> tuple[Union[datetime, float], float]:
+    def min(self) -> tuple[Union[datetime64, float], float]:
         """Returns the (time, value) of the minimum value in the minima peaks, or (nan, nan) if no valid minima."""
-        if self.minima.ndim == 2 and self.minima.shape[1] == 2 and len(self.minima) > 0:
-            m = argmin(self.minima[:, 1])
-            return self.minima[m, 0], self.minima[m, 1]
+        if len(self.min_values) > 0:
+            m = argmin(self.min_values)
+            return self.min_times[m], self.min_values[m]
         return nan, nan
 
     @property
@@ -146,10 +167,10 @@ class AccelerationPeaks:
         Computes the temporal frequency of peaks in [1/year], using the mean difference
         in time between consecutive peaks. Handles missing peaks by averaging over available data.
         """
-        if len(self.maxima) < 2:
+        if len(self.max_times) < 2:
             return 0.0
 
-        time_diffs = diff(self.maxima[:, 0]).astype("timedelta64[D]").astype(int)
+        time_diffs = diff(self.max_times).astype("timedelta64[D]").astype(int)
         avg_time_diff = mean(time_diffs)
 
         return 365.25 / avg_time_diff if avg_time_diff > 0 else 0.0
@@ -3,10 +3,10 @@
 from dataclasses import fields, make_dataclass
 from datetime import datetime
 from typing import List, Tuple, Type, Union
-from warnings import catch_warnings, simplefilter
 
-from numpy import array, genfromtxt, recarray
-from pandas import DataFrame, isna, read_csv, to_datetime
+from numpy import recarray
+from pandas import DataFrame, read_csv, to_datetime
+from pandas.api.types import is_datetime64_any_dtype
 
 
 ColumnType = Union[List[Tuple[str, Type]], Type]
@@ -23,7 +23,14 @@ def frame_to_dataclasses(df: DataFrame, dataclass_type: Type) -> List:
     """
     Convert a pandas DataFrame to a list of dataclass instances.
     """
-    return [dataclass_type(**row) for row in df.to_dict(orient="records")]
+    # Gather the fields present in the frame; missing ones fall back to their dataclass defaults
+    names = [field.name for field in fields(dataclass_type) if field.name in df.columns]
+    positions = [df.columns.get_loc(name) for name in names]
+
+    return [
+        dataclass_type(**{name: row[i] for name, i in zip(names, positions)})
+        for row in df.itertuples(index=False, name=None)
+    ]
 
 
 def load_csv_dataframe(file_path: str, columns: ColumnType = None, tzinfo=None) -> DataFrame:
@@ -33,90 +40,47 @@ def load_csv_dataframe(file_path: str, columns: ColumnType = None, tzinfo=None)
     # Process column definitions
     column_formats = _process_column_formats(columns)
     column_names = [name for name, _ in column_formats]
+    datetime_columns = _datetime_columns(column_formats)
 
     # Load CSV, skip the first row (header), and use custom column names
-    df = read_csv(
-        file_path,
-        header=None,
-        skiprows=1,
-        names=column_names,
-        parse_dates=[name for name, dtype in column_formats if dtype == datetime],
-    )
+    df = read_csv(file_path, header=None, skiprows=1, names=column_names, parse_dates=datetime_columns)
 
     # Ensure datetime columns are properly converted and set timezone
-    for name, dtype in column_formats:
-        if dtype == datetime:
+    for name in datetime_columns:
+        if not is_datetime64_any_dtype(df[name]):
             df[name] = to_datetime(df[name], errors="coerce")  # Convert to datetime, handling errors
-            df[name] = df[name].apply(
-                lambda dt: dt.replace(tzinfo=tzinfo) if not isna(dt) and dt.tzinfo is None else dt
-            )
+        if tzinfo is not None and df[name].dt.tz is None:
+            df[name] = df[name].dt.tz_localize(tzinfo, nonexistent="shift_forward", ambiguous="NaT")
 
     return df
 
 
 def load_csv_array(file_path: str, columns: ColumnType = None, tzinfo=None) -> recarray:
     """
-    Load CSV file using numpy, handling datetime columns and making them timezone-aware.
+    Load CSV file into a numpy recarray, handling datetime columns and making them timezone-aware. As numpy datetimes
+    are naive, timezone-aware columns are stored as native datetime64 fields in UTC.
     """
-    # Process column definitions
-    column_formats = _process_column_formats(columns)
-    column_names = [name for name, _ in column_formats]
-
-    # Define dtype for structured array with custom column names
-    dtype = [(name, "datetime64" if dtype == datetime else dtype) for name, dtype in column_formats]
-
-    # Suppress ConversionWarning during genfromtxt call and skip the header row
-    with catch_warnings():
-        simplefilter("ignore", category=UserWarning)
-        data = genfromtxt(
-            file_path,
-            delimiter=",",
-            skip_header=1,
-            names=column_names,
-            dtype=dtype,
-            encoding="utf-8",
-            invalid_raise=False,
-        )
+    df = load_csv_dataframe(file_path, columns, tzinfo)
 
-    # Convert to record array and apply timezone to datetime fields
-    rec_data = data.view(recarray)
-    for name, dtype in column_formats:
-        if dtype == datetime:
-            times = array([datetime.fromisoformat(str(d)).replace(tzinfo=tzinfo) for d in rec_data[name]])
-            rec_data[name] = times
+    # Convert timezone-aware columns to UTC in a single pass, rather than leaving per-element Timestamp objects
+    for name in _datetime_columns(_process_column_formats(columns)):
+        if df[name].dt.tz is not None:
+            df[name] = df[name].dt.tz_convert("UTC").dt.tz_localize(None)
 
-    return rec_data
+    return frame_to_array(df)
 
 
 def load_csv_dataclasses(file_path: str, columns: ColumnType, tzinfo=None) -> List:
     """
-    Load CSV file using numpy, convert each row into a dataclass instance, handling datetime and timezone awareness.
+    Load CSV file and convert each row into a dataclass instance, handling datetime and timezone awareness.
     """
     # Process column definitions
     column_formats = _process_column_formats(columns)
 
-    # Define dtype for structured array
-    dtype = [(name, "datetime64" if dtype == datetime else dtype) for name, dtype in column_formats]
-
-    # Suppress ConversionWarning during genfromtxt call
-    with catch_warnings():
-        simplefilter("ignore", category=UserWarning)
-        data = genfromtxt(file_path, delimiter=",", names=True, dtype=dtype, encoding="utf-8", invalid_raise=False)
-
     # Prepare data as list of dataclass instances
     dataclass_type = columns if isinstance(columns, type) else make_dataclass("DynamicDataClass", column_formats)
-    instances = []
-    for row in data:
-        row_data = {}
-        for (name, dtype), value in zip(column_formats, row):
-            if dtype == datetime:
-                dt = datetime.fromisoformat(str(value)).replace(tzinfo=tzinfo)
-                row_data[name] = dt
-            else:
-                row_data[name] = value
-        instances.append(dataclass_type(**row_data))
 
-    return instances
+    return frame_to_dataclasses(load_csv_dataframe(file_path, column_formats, tzinfo), dataclass_type)
 
 
 def _process_column_formats(columns: ColumnType) -> List[Tuple[str, Type]]:
@@ -126,3 +90,10 @@ def _process_column_formats(columns: ColumnType) -> List[Tuple[str, Type]]:
     if isinstance(columns, type) and hasattr(columns, "__dataclass_fields__"):
         return [(field.name, field.type) for field in fields(columns)]
     return columns
+
+
+def _datetime_columns(column_formats: List[Tuple[str, Type]]) -> List[str]:
+    """
+    Return the names of the datetime columns.
+    """
+    return [name for name, dtype in column_formats if dtype is datetime]
@@ -1,10 +1,11 @@
 from matplotlib.colors import BoundaryNorm, Normalize
 from matplotlib.pyplot import Figure, ion, show, subplots
-from numpy import nan, triu_indices_from, unique, zeros_like
+from numpy import (diag, errstate, fill_diagonal, maximum, nan, nanmax, nanmin,
+                   triu_indices_from, where, zeros_like)
 from pandas import DataFrame, read_pickle
 from seaborn import heatmap
 
-from energy_explorer.es_explorer import get_capacity_distribution
+from energy_explorer.es_explorer import build_fuel_onehot, count_fuel_types
 
 
 def fuel_capacity_chart(frame: DataFrame, exclusive: bool = True, shared: bool = False, bin_size: int = None) -> Figure:
@@ -18,37 +19,49 @@ def fuel_capacity_chart(frame: DataFrame, exclusive: bool = True, shared: bool =
         bin_size: Optional; if provided, chunks the color mapping into bins of the specified size.
     """
     # Filter for entries with 1 or 2 fuel types
-    subset_frame = frame[frame.fuel_types.apply(len) <= 2]
-
-    # Get the unique fuel types
-    fuel_types = unique(subset_frame.explode("fuel_types").fuel_types)
-
-    # Initialize a matrix to store the mean capacities for each pair of fuel types
-    capacity_matrix = DataFrame(nan, index=fuel_types, columns=fuel_types)
-
-    # Calculate the capacity mean for each pair of fuel types
-    for i, fuel_type_i in enumerate(fuel_types):
-        for j, fuel_type_j in enumerate(fuel_types[i:], start=i):
-            # Set up the filter condition
-            fuel_list = [fuel_type_i, fuel_type_j] if fuel_type_i != fuel_type_j else [fuel_type_i]
-            dist = get_capacity_distribution(subset_frame, fuel_type=fuel_list, exclusive=exclusive, shared=shared)
+    subset_frame = frame[count_fuel_types(frame) <= 2]
+
+    # Build the fuel type membership of each entry, weighted by its (optionally shared) capacity
+    onehot = build_fuel_onehot(subset_frame)
+    membership = onehot.to_numpy(dtype=float)
+    n_fuels = membership.sum(axis=1)
+    capacity = subset_frame.nameplate_capacity.to_numpy(dtype=float)
+    if shared:
+        capacity = capacity / maximum(n_fuels, 1.0)
+
+    if exclusive:
+        # Entries with exactly two fuel types fill the off-diagonal, and those with one type fill the diagonal
+        single = membership * (n_fuels == 1)[:, None]
+        pair = membership * (n_fuels == 2)[:, None]
+        counts = pair.T @ pair
+        totals = pair.T @ (pair * capacity[:, None])
+        fill_diagonal(counts, single.sum(axis=0))
+        fill_diagonal(totals, single.T @ capacity)
+    else:
+        # Entries containing either fuel type of a pair, by inclusion-exclusion over the co-occurrences
+        joint_counts = membership.T @ membership
+        joint_totals = membership.T @ (membership * capacity[:, None])
+        counts = diag(joint_counts)[:, None] + diag(joint_counts)[None, :] - joint_counts
+        totals = diag(joint_totals)[:, None] + diag(joint_totals)[None, :] - joint_totals
 
-            # Assign the mean capacity value to the matrix
-            mean_capacity = dist.capacity.mean() if len(dist.capacity) > 0 else nan
-            capacity_matrix.at[fuel_type_i, fuel_type_j] = mean_capacity
-            capacity_matrix.at[fuel_type_j, fuel_type_i] = mean_capacity
+    # Calculate the capacity mean for each pair of fuel types, leaving empty pairs as NaN
+    with errstate(invalid="ignore", divide="ignore"):
+        mean_capacity = where(counts > 0, totals / counts, nan)
+    capacity_matrix = DataFrame(mean_capacity, index=onehot.columns, columns=onehot.columns)
 
     # Mask the upper triangle to only show the lower triangle
     mask = zeros_like(capacity_matrix, dtype=bool)
     mask[triu_indices_from(mask, k=1)] = True
 
+    # Find the capacity range of the matrix once
+    min_capacity, max_capacity = nanmin(mean_capacity), nanmax(mean_capacity)
+
     # Define the color mapping based on bin_size
     if bin_size:
-        min_capacity, max_capacity = 0.0, capacity_matrix.max().max()
-        bins = list(range(int(min_capacity), int(max_capacity) + bin_size, bin_size))
+        bins = list(range(0, int(max_capacity) + bin_size, bin_size))
         norm = BoundaryNorm(bins, ncolors=256)
     else:
-        norm = Normalize(vmin=capacity_matrix.min().min(), vmax=capacity_matrix.max().max())
+        norm = Normalize(vmin=min_capacity, vmax=max_capacity)
 
     # Label
     label = "Mean Shared Capacity [kW]" if shared else "Mean Capacity [kW]"
@@ -84,18 +97,18 @@ def fuel_approval_chart(frame: DataFrame, exclusive: bool = False, bin_size: int
     """
     # Convert approval_date to period for yearly grouping
     approval_year = frame.approval_date.dt.to_period("Y")
-    fuel_types = frame.fuel_types.explode()
+    fuel_types = frame.fuel_types.explode().astype("category")
 
     # Count approvals by year and fuel type
     approval_counts = (
         DataFrame({"approval_year": approval_year, "fuel_type": fuel_types})
-        .groupby(["fuel_type", "approval_year"])
+        .groupby(["fuel_type", "approval_year"], observed=True)
         .size()
         .unstack(fill_value=0)
     )
 
     # Define the color mapping based on bin_size
-    min_count, max_count = 0, approval_counts.max().max()
+    min_count, max_count = 0, approval_counts.to_numpy().max()
 
     # Adjust bin_size to fit within colormap limits
     max_bins = 256
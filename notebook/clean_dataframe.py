@@ -2,12 +2,16 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import List, Optional, Tuple
 
-from pandas import DataFrame
+from pandas import DataFrame, factorize
 from pgeocode import Nominatim
 
 from energy_explorer.readers import load_csv_dataframe
 
 
+# Low-cardinality string columns which are stored as the `category` dtype
+CATEGORICAL_COLUMNS = ["utility", "facility_city", "facility_county", "caiso_flag", "customer_sector"]
+
+
 @dataclass
 class EnergyStorage:
     utility: str
@@ -24,8 +28,8 @@ class EnergyStorage:
 
 def clean_energy_storage_dataframe(frame: DataFrame) -> DataFrame:
     """
-    Cleans the Energy Storage DataFrame by processing each row, updating fuel types, adding geo_coords, and modifying
-    the DataFrame in place.
+    Cleans the Energy Storage DataFrame by processing each row, updating fuel types, counting them (n_fuels), adding
+    geo_coords, and modifying the DataFrame in place.
 
     Args:
         frame (DataFrame): The initial uncleaned DataFrame.
@@ -33,15 +37,20 @@ def clean_energy_storage_dataframe(frame: DataFrame) -> DataFrame:
     print("Starting full cleaning process for the energy storage DataFrame...", flush=True)
     print("Tasks: Process fuel types - Add geo-coordinates", flush=True)
 
-    # Process each row for fuel types
-    n = len(frame)
-    for m, row in frame.iterrows():
-        progress_line("Processing rows", m, n)
-        frame.at[m, "fuel_types"] = sort_fuel_types(frame.at[m, "fuel_types"])
+    # Process each distinct fuel type entry once, and map the results back onto the rows
+    codes, unique_fuel_types = factorize(frame.fuel_types, use_na_sentinel=False)
+    sorted_fuel_types = [sort_fuel_types(fuel_types) for fuel_types in unique_fuel_types]
+    frame["fuel_types"] = [list(sorted_fuel_types[code]) for code in codes]
+
+    # Count the fuel types of each entry once
+    frame["n_fuels"] = frame.fuel_types.str.len().astype("int8")
 
     # Add geo coordinates for unique zipcodes
     add_geo_coords_to_frame(frame)
 
+    # Compact the repeated string columns
+    frame = categorize_columns(frame)
+
     print("...done.")
 
     return frame
@@ -57,17 +66,10 @@ def add_geo_coords_to_frame(frame: DataFrame) -> DataFrame:
     # Initialize Nominatim for geolocation
     nomi = Nominatim("us")
 
-    # Extract unique zipcodes and set up dictionary for mapping
+    # Look up all unique zipcodes in a single query, and set up dictionary for mapping
     unique_zipcodes = frame.facility_zipcode.unique()
-    n = len(unique_zipcodes)
-
-    zip_to_coords = {}
-    for m, zipcode in enumerate(unique_zipcodes):
-        progress_line("Mapping geo-coordinates", m, n)
-        location = nomi.query_postal_code(str(zipcode))
-        zip_to_coords[zipcode] = (
-            (location.latitude, location.longitude) if location.latitude and location.longitude else (None, None)
-        )
+    locations = nomi.query_postal_code([str(zipcode) for zipcode in unique_zipcodes])
+    zip_to_coords = dict(zip(unique_zipcodes, zip(locations.latitude, locations.longitude)))
 
     # Map coordinates to the DataFrame
     frame.geo_coords = frame.facility_zipcode.map(zip_to_coords)
@@ -75,16 +77,33 @@ def add_geo_coords_to_frame(frame: DataFrame) -> DataFrame:
     return frame
 
 
+def categorize_columns(frame: DataFrame) -> DataFrame:
+    """
+    Converts the low-cardinality string columns to the `category` dtype and downcasts the zipcodes to `int32`. The
+    categories are left unordered, so equality, `isin` and `groupby` operate on the integer codes; any group-by over
+    these columns should pass `observed=True` to skip empty categories.
+
+    Args:
+        frame: The DataFrame containing energy storage data.
+    """
+    for column in CATEGORICAL_COLUMNS:
+        frame[column] = frame[column].astype("category")
+
+    frame["facility_zipcode"] = frame.facility_zipcode.astype("int32")
+
+    return frame
+
+
 def sort_fuel_types(fuel_types: str) -> List[str]:
     """
     Processes and formats a fuel type entry by splitting on delimiters, capitalizing each component, and recombining
-    them with a space separator.
+    them with a space separator. Each fuel type appears at most once in the result.
 
     Args:
         fuel_types: A string which is intended to be a list of fuel types, delimited by "_ ".
 
     Returns:
-        List[str]: A list of cleaned and formatted fuel type strings.
+        List[str]: A list of distinct, cleaned and formatted fuel type strings.
     """
     formatted_fuel_types = []
 
@@ -96,14 +115,8 @@ def sort_fuel_types(fuel_types: str) -> List[str]:
         fuel_type_cleaned = fuel_type_capitalized.replace(" / ", "/").replace(" Pv", "")
         formatted_fuel_types.append(fuel_type_cleaned)
 
-    return formatted_fuel_types
-
-
-def progress_line(description, m, n) -> None:
-    """Prints a clean progress line."""
-    p = 100 * (m + 1) / n
-    print(f"{description}: {p:.0f}% of {n} entries.", end="\r", flush=True)
-    print("\033[K", end="\r", flush=True) if p == 100 else None
+    # Drop repeated fuel types, keeping the first occurrence
+    return list(dict.fromkeys(formatted_fuel_types))
 
 
 if __name__ == "__main__":
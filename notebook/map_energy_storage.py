@@ -1,35 +1,10 @@
-from numpy import array
-from numpy.typing import NDArray
-from pandas import read_pickle
-from pgeocode import Nominatim
+from pandas import DataFrame, read_pickle
 
+from energy_explorer.es_explorer import get_unique_zip_geo
 from energy_explorer.paths import ENERGY_STORAGE_CLEANED_PATH
 from energy_explorer.plotters import MapPlotter
 
 
-def zipcode_to_geo(zipcodes: NDArray[int]) -> NDArray[float]:
-    """
-    Convert an array of zipcodes to latitude and longitude coordinates using pgeocode.
-
-    Args:
-        zipcodes: Array of zipcodes.
-
-    Returns:
-        NDArray[float]: An array of (lat, lon) pairs.
-    """
-    nomi = Nominatim("us")
-    coordinates = []
-
-    for zipcode in zipcodes:
-        location = nomi.query_postal_code(str(zipcode))
-        if location.latitude and location.longitude:
-            coordinates.append((location.latitude, location.longitude))
-        else:
-            coordinates.append((None, None))
-
-    return array(coordinates)
-
-
 if __name__ == "__main__":
     # Load the cleaned data
     es_frame = read_pickle(ENERGY_STORAGE_CLEANED_PATH)
@@ -37,23 +12,27 @@ if __name__ == "__main__":
     # Filter data by sector "Residential" before all other operations
     es_frame_res = es_frame[es_frame.customer_sector == "Residential"]
 
-    # Extract and plot all unique zip codes
-    unique_zipcodes = es_frame_res.facility_zipcode.drop_duplicates().values
-    unique_geo = zipcode_to_geo(unique_zipcodes)
+    # Extract and plot all unique zip codes, reusing the coordinates stored by the cleaning step
+    unique_zipcodes, unique_geo = get_unique_zip_geo(es_frame_res)
+    geo_by_zipcode = DataFrame(unique_geo, index=unique_zipcodes)
 
     # Initialize the map plotter, and plot the full set of unique zipcodes
     energy_map = MapPlotter()
     energy_map.plot_coords(unique_geo, color="blue", marker="o", markersize=1, alpha=0.25)
 
     # Calculate total capacity by city within and extract the top 5 cities
-    top_cities = es_frame_res.groupby("facility_city").nameplate_capacity.sum().sort_values(ascending=False).head(5)
+    capacity_by_city = es_frame_res.groupby("facility_city", observed=True).nameplate_capacity.sum()
+    top_cities = capacity_by_city.sort_values(ascending=False).head(5)
+
+    # Collect the unique zipcodes of the top 5 cities in a single pass
+    top_city_frame = es_frame_res[es_frame_res.facility_city.isin(top_cities.index)]
+    zipcodes_by_city = top_city_frame.groupby("facility_city", observed=True).facility_zipcode.unique()
 
     # Plot each of the top 5 cities
     colors = ["tab:red", "tab:blue", "tab:green", "tab:orange", "tab:purple"]
-    for i, (city, _) in enumerate(top_cities.items()):
-        city_data = es_frame_res[es_frame_res.facility_city == city]
-        city_zipcodes = city_data.facility_zipcode.unique()
-        city_geo = zipcode_to_geo(city_zipcodes)
+    for i, city in enumerate(top_cities.index):
+        city_zipcodes = zipcodes_by_city[city]
+        city_geo = geo_by_zipcode.loc[city_zipcodes].to_numpy()  # Reuse the coordinates looked up above
 
         energy_map.plot_coords(city_geo, color=colors[i], marker="o", markersize=2, label=city)
 
@@ -3,7 +3,7 @@ from datetime import datetime
 from typing import Optional, Tuple
 
 from matplotlib.pyplot import Figure, setp, show, subplots
-from numpy import histogram2d, where
+from numpy import histogram2d
 from pandas import DataFrame
 
 from energy_explorer.readers import load_csv_dataframe
@@ -30,9 +30,9 @@ def clean_power_data(frame: DataFrame) -> DataFrame:
     # Sort by timestamp
     frame = frame.sort_values(by="timestamp")
 
-    # Normalize power factor to 1.0 scale
-    frame.power_factor_lagging /= 100.0
-    frame.power_factor_leading /= 100.0
+    # Normalize power factor to 1.0 scale, assigning whole columns of the sorted copy
+    frame["power_factor_lagging"] = frame.power_factor_lagging / 100.0
+    frame["power_factor_leading"] = frame.power_factor_leading / 100.0
 
     # Compute month
     frame["month"] = frame.timestamp.dt.month
@@ -73,22 +73,18 @@ def plot_co2_heatmap(frame: DataFrame, x_column: Tuple[str, str], y_column: Tupl
     x_name, x_units = x_column
     y_name, y_units = y_column
 
-    # Numpize
-    x_ = frame[x_name].to_numpy()
-    y_ = frame[y_name].to_numpy()
-    co2_ = frame.co2_emission.to_numpy()
+    # Numpize, extracting the three columns together
+    values = frame[[x_name, y_name, "co2_emission"]].to_numpy(dtype=float)
 
-    # Select only the data with non-zero values
-    w = where((x_ / x_.max() > 0.02) & (y_ / y_.max() > 0.02) & (co2_ / co2_.max() > 0.02))[0]
-    x = x_[w]
-    y = y_[w]
-    co2 = co2_[w]
+    # Select only the data with non-zero values, reducing the maximum of each column in one pass
+    mask = (values > 0.02 * values.max(axis=0)).all(axis=1)
+    x, y, co2 = values[mask].T
 
     # Initialize the figure and axes
     fig, ax = subplots(figsize=(8, 6))
 
     # Generate heatmap
-    h, xedges, yedges = histogram2d(x, y, bins=50, weights=co2)
+    h, xedges, yedges = histogram2d(x, y, bins=(50, 50), density=False, weights=co2)
     im = ax.imshow(
         h.T,
         origin="lower",
@@ -2,9 +2,10 @@ from datetime import datetime, timedelta
 
 from pandas import read_pickle
 
-from energy_explorer.es_explorer import (find_acceleration_peaks,
+from energy_explorer.es_explorer import (build_fuel_onehot,
+                                         build_group_capacity_series,
+                                         find_acceleration_peaks,
                                          query_capacity_series)
-from energy_explorer.objects import CapacitySeries
 from energy_explorer.paths import ENERGY_STORAGE_CLEANED_PATH
 from energy_explorer.plotters import TimeSeriesPlotter
 
@@ -35,6 +36,9 @@ if __name__ == "__main__":
     # Filter data to only include entries within the specified date range
     es_frame = es_frame[(es_frame.approval_date >= START_DATE) & (es_frame.approval_date < END_DATE)]
 
+    # Build the fuel type one-hot table once, and share it between the queries of the data
+    fuel_onehot = build_fuel_onehot(es_frame)
+
     # Query data for the top groups based on cumulative capacity
     top_groups = query_capacity_series(
         es_frame=es_frame,
@@ -44,6 +48,7 @@ if __name__ == "__main__":
         group_by=GROUP_BY,
         n_groups=N_GROUPS,
         select_from=SELECT_FROM,
+        onehot=fuel_onehot,
     )
 
     # Initialize plotter with two axes
@@ -56,21 +61,15 @@ if __name__ == "__main__":
     global_start = max(top_groups.approval_date.min().to_pydatetime(), START_DATE)
     global_end = min(top_groups.approval_date.max().to_pydatetime(), END_DATE)
 
+    # Build the smoothed capacity series of each group
+    group_series = build_group_capacity_series(
+        top_groups, GROUP_BY, start=global_start, end=global_end, delta=T_DELTA, sigma=T_SIGMA
+    )
+
     # Plot each group's data
-    for n, group_id in enumerate(top_groups[GROUP_BY].unique()):
-        group_data = top_groups[top_groups[GROUP_BY] == group_id].sort_values(by="approval_date")
+    for n, (group_id, capacity_series) in enumerate(group_series.items()):
         group_color = f"C{n}"
 
-        # Calculate cumulative capacity
-        date = group_data.approval_date.to_numpy()
-        capacity = group_data.nameplate_capacity.cumsum().to_numpy() / 1000  # Convert to MW
-
-        # Create the series
-        capacity_series = CapacitySeries(time=date, capacity=capacity)
-
-        # Smooth the capacity series using the specified start, end, delta, and sigma parameters
-        capacity_series.smooth(start=global_start, end=global_end, delta=T_DELTA, sigma=T_SIGMA)
-
         # Plot data
         plotter.plot_series(0, capacity_series.time, capacity_series.capacity, color=group_color, label=f"{group_id}")
         plotter.plot_series(
@@ -1,11 +1,18 @@
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import Tuple
+from functools import partial
+from os import cpu_count
+from typing import List, Tuple
 
 import matplotlib.pyplot as plt
-from numpy import nan_to_num, nanmax, zeros
+from numpy import (correlate, inf, isnan, nan_to_num, nanmax, ones, sqrt,
+                   tril_indices, where, zeros)
+from numpy.typing import NDArray
 from pandas import read_pickle
 
-from energy_explorer.es_explorer import query_capacity_series
+from energy_explorer.es_explorer import (build_fuel_onehot,
+                                         build_group_capacity_series,
+                                         query_capacity_series)
 from energy_explorer.objects import CapacitySeries
 from energy_explorer.paths import ENERGY_STORAGE_CLEANED_PATH
 
@@ -16,7 +23,8 @@ def compute_pair_correlation(
     """
     Compute the maximum correlation and corresponding shift for two CapacitySeries objects based on their accelerations.
     Correlate only the region around the peak acceleration of series_m with the full acceleration of series_n. The shift
-    is constrained to a maximum distance of `max_shift`.
+    is constrained to a maximum distance of `max_shift`. The correlation is normalized by the norms of the kernel and of
+    each shifted window, so it lies within [-1, 1] regardless of the magnitude of either series.
 
     Args:
         series_m: The reference CapacitySeries object.
@@ -26,7 +34,7 @@ def compute_pair_correlation(
         t_delta: Sampling time delta.
 
     Returns:
-        max_corr: Maximum correlation value found within the allowable shift.
+        max_corr: Maximum normalized correlation value found within the allowable shift.
         shift: Corresponding shift value (in time steps) that gives the maximum correlation.
     """
     # Extract acceleration data and time series from both CapacitySeries
@@ -47,38 +55,90 @@ def compute_pair_correlation(
     # Make sure the kernel is free of NaNs (which could have resulted from smoothing or other processes)
     kernel = nan_to_num(kernel)
 
-    # Calculate the length of the kernel
-    kernel_length = len(kernel)
+    # Determine the range of shifts for which the shifted window lies fully within accel_n
+    lowest_shift = max(-max_shift, t_width - m_peak)
+    highest_shift = min(max_shift, len(accel_n) - 1 - t_width - m_peak)
 
-    # Initialize variables to track the best correlation and corresponding shift
-    max_corr = -float("inf")
-    best_shift = 0
+    # Without a full-width kernel or any valid shift there is nothing to correlate
+    if len(kernel) != 2 * t_width or lowest_shift > highest_shift:
+        return -float("inf"), 0
 
-    # Iterate over possible shifts (from -max_shift to +max_shift)
-    for shift in range(-max_shift, max_shift + 1):
-        # Determine the start and end indices of the window within accel_n based on the current shift
-        shifted_center = m_peak + shift
+    # Correlate the kernel with every shifted window of accel_n at once
+    segment_accel_n = accel_n[m_peak + lowest_shift - t_width : m_peak + highest_shift + t_width]
+    correlation_values = correlate(segment_accel_n, kernel, mode="valid")
 
-        # Ensure that the center of the kernel is within valid bounds for accel_n
-        if shifted_center - t_width < 0 or shifted_center + t_width >= len(accel_n):
-            continue  # Skip invalid shifts
+    # Normalize by the norms of the kernel and of each window (zero-norm windows are left unnormalized)
+    window_norms = sqrt(correlate(segment_accel_n**2, ones(len(kernel)), mode="valid") * (kernel**2).sum())
+    correlation_values /= where(window_norms > 0, window_norms, 1.0)
 
-        # Extract the corresponding segment from accel_n
-        segment_start = shifted_center - t_width
-        segment_end = shifted_center + t_width
-        segment_accel_n = accel_n[segment_start:segment_end]
+    # Take the first maximal correlation, ignoring windows which contain NaNs
+    correlation_values[isnan(correlation_values)] = -inf
+    best_index = int(correlation_values.argmax())
+    max_corr = float(correlation_values[best_index])
+    best_shift = lowest_shift + best_index if max_corr > -inf else 0
 
-        # Ensure the segment is the same length as the kernel
-        if len(segment_accel_n) == kernel_length:
-            # Compute the correlation by convolving the kernel with the segment
-            correlation_value = (kernel * segment_accel_n).sum()
+    return max_corr, best_shift
 
-            # Update max_corr and best_shift if this correlation is greater
-            if correlation_value > max_corr:
-                max_corr = correlation_value
-                best_shift = shift
 
-    return max_corr, best_shift
+# Capacity series correlated by the rows computed in the current process
+_correlation_series: List[CapacitySeries] = []
+
+
+def _init_correlation_worker(all_series: List[CapacitySeries]) -> None:
+    """Share the capacity series with the rows computed by the current process."""
+    global _correlation_series
+    _correlation_series = all_series
+
+
+def _compute_correlation_row(m: int, max_shift: int, t_sigma: timedelta, t_delta: timedelta) -> List[Tuple[float, int]]:
+    """Compute the correlation and shift of series m against every series n <= m."""
+    return [
+        compute_pair_correlation(_correlation_series[m], _correlation_series[n], max_shift, t_sigma, t_delta)
+        for n in range(m + 1)
+    ]
+
+
+def compute_correlation_matrices(
+    all_series: List[CapacitySeries], max_shift: int, t_sigma: timedelta, t_delta: timedelta, n_workers: int = 1
+) -> Tuple[NDArray, NDArray]:
+    """
+    Compute the lower triangle of the maximum correlation and shift matrices for all pairs of CapacitySeries objects.
+
+    Args:
+        all_series: The CapacitySeries objects to correlate.
+        max_shift: Maximum allowable shift in terms of number of time steps.
+        t_sigma: Time window for smoothing.
+        t_delta: Sampling time delta.
+        n_workers: Number of processes computing the rows of the matrices (`1` computes them serially).
+
+    Returns:
+        max_corr_matrix: Maximum correlation of each pair of series.
+        shift_matrix: Corresponding shift of each pair of series (in time steps).
+    """
+    # Compute the accelerations once, so they are shared with the workers already cached
+    for series in all_series:
+        _ = series.acceleration  # Accessing the property fills its cache
+
+    # Compute each row of the lower triangle independently
+    compute_row = partial(_compute_correlation_row, max_shift=max_shift, t_sigma=t_sigma, t_delta=t_delta)
+    if n_workers > 1:
+        with ProcessPoolExecutor(
+            max_workers=n_workers, initializer=_init_correlation_worker, initargs=(all_series,)
+        ) as executor:
+            rows = list(executor.map(compute_row, range(len(all_series))))
+    else:
+        _init_correlation_worker(all_series)
+        rows = [compute_row(m) for m in range(len(all_series))]
+
+    # Store the results in the matrices
+    n_series = len(all_series)
+    max_corr_matrix = zeros((n_series, n_series))
+    shift_matrix = zeros((n_series, n_series))
+    for m, row in enumerate(rows):
+        max_corr_matrix[m, : m + 1] = [max_corr for max_corr, _ in row]
+        shift_matrix[m, : m + 1] = [shift for _, shift in row]
+
+    return max_corr_matrix, shift_matrix
 
 
 def plot_correlation_matrices(max_corr_matrix, shift_matrix):
@@ -97,13 +157,10 @@ def plot_correlation_matrices(max_corr_matrix, shift_matrix):
     axs[1].set_xlabel("Series Index")
     axs[1].set_ylabel("Series Index")
 
-    # Scatter plot of Correlation vs. Shift
-    x_shifts = []
-    y_correlations = []
-    for i in range(len(max_corr_matrix)):
-        for j in range(i + 1):
-            x_shifts.append(shift_matrix[i, j])
-            y_correlations.append(max_corr_matrix[i, j])
+    # Scatter plot of Correlation vs. Shift over the lower triangle (j <= i)
+    lower_triangle = tril_indices(len(max_corr_matrix))
+    x_shifts = shift_matrix[lower_triangle]
+    y_correlations = max_corr_matrix[lower_triangle]
 
     axs[2].scatter(x_shifts, y_correlations, color="b", alpha=0.7)
     axs[2].set_title("Correlation vs. Shift")
@@ -131,53 +188,45 @@ def main():
     START_DATE = datetime(2001, 1, 1)
     END_DATE = datetime(2025, 1, 1)
 
+    # Number of processes building the capacity series and correlations (`1` runs them serially)
+    N_WORKERS = max(1, (cpu_count() or 2) // 2)
+
     # Load and filter data
     es_frame = read_pickle(ENERGY_STORAGE_CLEANED_PATH)
     es_frame = es_frame[(es_frame.approval_date >= START_DATE) & (es_frame.approval_date < END_DATE)]
 
+    # Build the fuel type one-hot table once, and share it between the queries of the data
+    fuel_onehot = build_fuel_onehot(es_frame)
+
     # Retrieve the full set of capacity series
-    all_series = []
     top_groups = query_capacity_series(
         es_frame=es_frame,
         fuel_type=FUEL_TYPES,
         exclusive=EXCLUSIVE,
         sector=SECTOR,
         group_by=GROUP_BY,
+        onehot=fuel_onehot,
     )
 
     # Prepare and normalize each capacity series
-    for group_id in top_groups.facility_zipcode.unique():
-        group_data = top_groups[top_groups.facility_zipcode == group_id].sort_values(by="approval_date")
-        date = group_data.approval_date.to_numpy()
-        capacity = group_data.nameplate_capacity.cumsum().to_numpy() / 1000  # Convert to MW
-
-        # Create and smooth the capacity series
-        series = CapacitySeries(time=date, capacity=capacity)
-        series.smooth(start=START_DATE, end=END_DATE, delta=T_DELTA, sigma=T_SIGMA)
-
+    group_series = build_group_capacity_series(
+        top_groups, GROUP_BY, start=START_DATE, end=END_DATE, delta=T_DELTA, sigma=T_SIGMA, n_workers=N_WORKERS
+    )
+    all_series = list(group_series.values())
+    for series in all_series:
         # Normalize capacity by its maximum value
         series.capacity /= nanmax(series.capacity)
-        all_series.append(series)
-
-    # Create correlation matrices
-    n_series = len(all_series)
-    max_corr_matrix = zeros((n_series, n_series))
-    shift_matrix = zeros((n_series, n_series))
 
     # Calculate the max shift in points for 3 sigma
     max_shift = int((3 * T_SIGMA).total_seconds() / T_DELTA.total_seconds())
 
-    # Iterate over each pair of series to compute correlations
-    for m in range(n_series):
-        for n in range(m + 1):  # n <= m ensures only lower triangle is computed
-            max_corr, shift = compute_pair_correlation(all_series[m], all_series[n], max_shift, T_SIGMA, T_DELTA)
-
-            # Convert the shift into years
-            shift_years = (shift * T_DELTA.total_seconds()) / (365.25 * 24 * 3600)
+    # Compute the correlations over each pair of series (only the lower triangle, n <= m)
+    max_corr_matrix, shift_matrix = compute_correlation_matrices(
+        all_series, max_shift, T_SIGMA, T_DELTA, n_workers=N_WORKERS
+    )
 
-            # Store the results in the matrices
-            max_corr_matrix[m, n] = max_corr
-            shift_matrix[m, n] = shift_years
+    # Convert the shifts into years
+    shift_matrix = (shift_matrix * T_DELTA.total_seconds()) / (365.25 * 24 * 3600)
 
     # Normalize
     max_corr_matrix /= max_corr_matrix.max()
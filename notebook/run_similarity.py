@@ -1,43 +1,43 @@
-from copy import deepcopy
 from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
 
-from matplotlib.pyplot import show, subplots, tight_layout
-from numpy import clip, dot, isinf, isnan, nanmax, where, zeros
+from matplotlib.image import AxesImage
+from matplotlib.pyplot import (Figure, fignum_exists, show, subplots,
+                               tight_layout)
+from numpy import clip, eye, inf, isfinite, nanmax, stack, unravel_index, where
 from numpy.linalg import norm
 from numpy.typing import NDArray
 from pandas import read_pickle
 
-from energy_explorer.es_explorer import query_capacity_series
+from energy_explorer.es_explorer import (build_fuel_onehot,
+                                         build_group_capacity_series,
+                                         query_capacity_series)
 from energy_explorer.objects import CapacitySeries
 from energy_explorer.paths import ENERGY_STORAGE_CLEANED_PATH
 from energy_explorer.plotters import TimeSeriesPlotter
 
 
-def compute_cosine_similarity(series_m: CapacitySeries, series_n: CapacitySeries) -> float:
+def compute_similarity_matrix(all_series: List[CapacitySeries]) -> NDArray[float]:
     """
-    Compute the cosine similarity of the acceleration vectors of two CapacitySeries objects.
+    Compute the cosine similarity of the acceleration vectors of each pair of CapacitySeries objects.
 
     Args:
-        series_m: The first CapacitySeries object.
-        series_n: The second CapacitySeries object.
+        all_series: The CapacitySeries objects to compare, smoothed onto the same time grid.
 
     Returns:
-        float: Cosine similarity value between the acceleration vectors of series_m and series_n.
+        NDArray[float]: Symmetric matrix of the cosine similarities between the acceleration vectors.
     """
-    accel_m = series_m.acceleration
-    accel_n = series_n.acceleration
+    # Stack the accelerations, which share the sampling grid of the series
+    if len({len(series.acceleration) for series in all_series}) > 1:
+        raise ValueError("all series must be sampled on the same time grid")
+    accelerations = stack([series.acceleration for series in all_series])
 
-    # Ensure both series are of the same length
-    min_len = min(len(accel_m), len(accel_n))
-    accel_m = accel_m[:min_len]
-    accel_n = accel_n[:min_len]
+    # Normalize each acceleration vector once, so that their dot products are the cosine similarities (the norms are
+    # tiny, so zero norms are guarded rather than offset by an epsilon)
+    norms = norm(accelerations, axis=1, keepdims=True)
+    accelerations /= where(norms > 0, norms, 1.0)
 
-    # Compute the dot product and norms
-    dot_product = dot(accel_m, accel_n)
-    norm_m = norm(accel_m)
-    norm_n = norm(accel_n)
-
-    return dot_product / (norm_m * norm_n + 1e-9)
+    return accelerations @ accelerations.T
 
 
 def predict_capacity_series(
@@ -55,43 +55,52 @@ def predict_capacity_series(
     Returns:
         CapacitySeries: The predicted CapacitySeries object.
     """
-    # Deepcopy the n series for modification
-    series_p = deepcopy(series_n)
+    # Copy only the capacity of the n series for modification, sharing its (unmodified) time
+    series_p = CapacitySeries(time=series_n.time, capacity=series_n.capacity.copy())
 
     # Set the second half of the n_series_modified capacity to zero
     midpoint = len(series_p.capacity) // 2
     series_p.capacity[midpoint:] = 0
 
     # Cap the similarity coefficient within a reasonable range to avoid overflow
-    similarity_coeff = clip(similarity_coeff, -1.0, 1.0)
-
-    # Use m's capacity to predict n's future capacity
-    for t in range(midpoint - 1, len(series_p.capacity) - 1):
-        # Compute the fractional change in capacity for series m
-        dc_m = series_m.capacity[t + 1] - series_m.capacity[t]
+    similarity_coeff = min(max(float(similarity_coeff), -1.0), 1.0)
 
-        # Compute the change in capacity for the predicted series based on similarity coefficient
-        dc_p = 2.0 * dc_m * similarity_coeff**2
+    # Use m's capacity to predict n's future capacity; the accumulated changes telescope to the change of series m
+    # since the midpoint, scaled based on the similarity coefficient
+    capacity_m = series_m.capacity[midpoint - 1 : len(series_p.capacity)]
+    predicted_capacity = series_p.capacity[midpoint - 1] + 2.0 * similarity_coeff**2 * (capacity_m[1:] - capacity_m[0])
 
-        # Update the capacity for the predicted series
-        predicted_capacity = series_p.capacity[t] + dc_p
+    # Handle potential overflow, invalid values, or NaNs
+    predicted_capacity[~isfinite(predicted_capacity)] = 0.0
+    series_p.capacity[midpoint:] = clip(predicted_capacity, -1e9, 1e9)
 
-        # Handle potential overflow, invalid values, or NaNs
-        if isnan(predicted_capacity) or isinf(predicted_capacity):
-            predicted_capacity = 0
+    return series_p
 
-        series_p.capacity[t + 1] = clip(predicted_capacity, -1e9, 1e9)
 
-    return series_p
+# Figure and image of the last similarity matrix plot, reused when `main` is re-run interactively
+_similarity_plot: Optional[Tuple[Figure, AxesImage]] = None
 
 
 def plot_similarity_matrix(similarity_matrix: NDArray[float], title: str = "Cosine Similarity Matrix") -> None:
-    """Plot the similarity matrix."""
-    fig, ax = subplots(figsize=(7, 6))
-    ax.set(title=title)
-    cax = ax.imshow(similarity_matrix, cmap="viridis", aspect="auto")
-    fig.colorbar(cax)
-    tight_layout()
+    """Plot the similarity matrix, updating the previous plot in place while its figure is still open."""
+    global _similarity_plot
+
+    if _similarity_plot is not None and fignum_exists(_similarity_plot[0].number):
+        # Replace the image data, rescaling its color limits and extent to the new matrix
+        fig, cax = _similarity_plot
+        cax.set_data(similarity_matrix)
+        cax.set_extent((-0.5, similarity_matrix.shape[1] - 0.5, similarity_matrix.shape[0] - 0.5, -0.5))
+        cax.autoscale()
+        cax.axes.set(title=title)
+        fig.canvas.draw_idle()
+    else:
+        fig, ax = subplots(figsize=(7, 6))
+        ax.set(title=title)
+        cax = ax.imshow(similarity_matrix, cmap="viridis", aspect="auto")
+        fig.colorbar(cax)
+        tight_layout()
+        _similarity_plot = fig, cax
+
     show()
 
 
@@ -112,12 +121,18 @@ def main() -> NDArray[float]:
     START_DATE = datetime(2001, 1, 1)
     END_DATE = datetime(2025, 1, 1)
 
+    # Number of processes building the capacity series (`1` builds them serially)
+    N_WORKERS = 1
+
     # Load the data
     es_frame = read_pickle(ENERGY_STORAGE_CLEANED_PATH)
 
     # Filter data to only include entries within the specified date range
     es_frame = es_frame[(es_frame.approval_date >= START_DATE) & (es_frame.approval_date < END_DATE)]
 
+    # Build the fuel type one-hot table once, and share it between the queries of the data
+    fuel_onehot = build_fuel_onehot(es_frame)
+
     # Query data for the top groups based on cumulative capacity
     top_groups = query_capacity_series(
         es_frame=es_frame,
@@ -127,47 +142,35 @@ def main() -> NDArray[float]:
         group_by=GROUP_BY,
         n_groups=N_GROUPS,
         select_from=SELECT_FROM,
+        onehot=fuel_onehot,
     )
 
     # Prepare and normalize each capacity series
-    all_series = []
-    for group_id in top_groups.facility_zipcode.unique():
-        group_data = top_groups[top_groups.facility_zipcode == group_id].sort_values(by="approval_date")
-        date = group_data.approval_date.to_numpy()
-        capacity = group_data.nameplate_capacity.cumsum().to_numpy() / 1000  # Convert to MW
-
-        # Create and smooth the capacity series
-        series = CapacitySeries(time=date, capacity=capacity)
-        series.smooth(start=START_DATE, end=END_DATE, delta=T_DELTA, sigma=T_SIGMA)
-
+    group_series = build_group_capacity_series(
+        top_groups, GROUP_BY, start=START_DATE, end=END_DATE, delta=T_DELTA, sigma=T_SIGMA, n_workers=N_WORKERS
+    )
+    all_series = list(group_series.values())
+    for series in all_series:
         # Normalize capacity by its maximum value
         series.capacity /= nanmax(series.capacity)
-        all_series.append(series)
-
-    # Create the similarity matrix
-    n_series = len(all_series)
-    similarity_matrix = zeros((n_series, n_series))
 
     # Calculate the cosine similarity for each pair of series
-    for m in range(n_series):
-        for n in range(m + 1):  # Only compute for lower triangle (n <= m)
-            similarity_score = compute_cosine_similarity(all_series[m], all_series[n])
-            similarity_matrix[m, n] = similarity_score
-            similarity_matrix[n, m] = similarity_score  # Symmetric matrix
-    similarity_matrix = similarity_matrix / (similarity_matrix.diagonal()[:, None] + 1e-9)
-
-    # Find the highest similarity coefficient below 0.99
-    highest_similarity = similarity_matrix[similarity_matrix < 0.99].max()
+    similarity_matrix = compute_similarity_matrix(all_series)
 
-    # Get the indices (m, n) for the highest similarity value
-    indices = where(similarity_matrix == highest_similarity)
-    m, n = int(indices[0][0]), int(indices[1][0])
+    # Find the pair (m, n) of distinct series with the highest similarity coefficient below 0.99, in a single pass
+    candidates = where((similarity_matrix < 0.99) & ~eye(len(similarity_matrix), dtype=bool), similarity_matrix, -inf)
+    best_index = candidates.argmax()
+    if not isfinite(candidates.flat[best_index]):
+        raise ValueError("no pair of distinct series has a similarity coefficient below 0.99")
+    m, n = map(int, unravel_index(best_index, candidates.shape))
+    highest_similarity = similarity_matrix[m, n]
 
     series_m = all_series[m]
     series_n = all_series[n]
     series_p = predict_capacity_series(series_m, series_n, highest_similarity)
 
     # Bounds calculation
+    similarity_score = highest_similarity
     alpha = 1.0 - 0.5 * similarity_score**2
 
     # Compute upper and lower bounds that grow with time